@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from uuid import UUID
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
@@ -11,6 +12,9 @@ import bcrypt
 SECRET_KEY = "your-secret-key-change-in-production"  # In production, use environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Only has to outlive opening the stream; an open stream is not cut off when it expires
+STREAM_TOKEN_EXPIRE_SECONDS = 60
+STREAM_TOKEN_SCOPE = "live"
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -107,6 +111,15 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+def is_admin_token(token: str) -> bool:
+    """Check a raw JWT without raising, for callers outside the dependency system."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    return payload.get("sub") == ADMIN_USERNAME and "scope" not in payload
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """Get current authenticated user from JWT token."""
     credentials_exception = HTTPException(
@@ -118,7 +131,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or "scope" in payload:
+            # Scoped tokens (e.g. stream tokens) are not valid for the rest of the API
             raise credentials_exception
         token_data = TokenData(username=username)
     except JWTError:
@@ -130,3 +144,26 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     
     return token_data.username
 
+
+
+def create_stream_token(quiz_id: UUID) -> str:
+    """Create a short-lived token that only opens the live results stream of one quiz."""
+    return create_access_token(
+        {"sub": ADMIN_USERNAME, "scope": STREAM_TOKEN_SCOPE, "quiz_id": str(quiz_id)},
+        expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    )
+
+
+async def get_stream_user(quiz_id: UUID, stream_token: str):
+    """Validate ?stream_token= (EventSource cannot set headers) against the requested quiz."""
+    try:
+        payload = jwt.decode(stream_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        payload = {}
+    if (
+        payload.get("sub") != ADMIN_USERNAME
+        or payload.get("scope") != STREAM_TOKEN_SCOPE
+        or payload.get("quiz_id") != str(quiz_id)
+    ):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate stream token")
+    return payload["sub"]
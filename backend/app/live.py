@@ -0,0 +1,352 @@
+"""Live quiz results pushed to proctor dashboards.
+
+``submit_quiz`` hands each committed attempt to the worker's ``EventPublisher``,
+which sends the queued events as one batched ``NOTIFY quiz_live`` every
+``LIVE_PUBLISH_INTERVAL_MS``, in its own transaction. A committing transaction
+that issued NOTIFY takes a database-wide lock on the notification queue, so
+keeping NOTIFY out of the submit transactions keeps their commits from being
+serialized at peak. Each worker holds a single ``LISTEN`` connection, watched
+from the event loop, and fans events out to its subscribers through one
+in-process ``QuizBroadcaster``. Watchers therefore add no database load beyond
+one aggregate query per quiz per worker, which seeds the running average.
+
+Each subscriber has a bounded queue (``LIVE_CLIENT_BUFFER`` events). A client
+that falls that far behind is dropped instead of slowing down the others.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import timedelta
+from typing import Optional
+from uuid import UUID
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy import func, select
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal, engine
+from app.models import Quiz, QuizAttempt
+
+logger = logging.getLogger(__name__)
+
+LIVE_CHANNEL = "quiz_live"
+LIVE_CLIENT_BUFFER = int(os.getenv("LIVE_CLIENT_BUFFER", "100"))
+LIVE_RECONNECT_SECONDS = 5
+LIVE_CONNECT_TIMEOUT_SECONDS = 5
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_PUBLISH_INTERVAL_MS = float(os.getenv("LIVE_PUBLISH_INTERVAL_MS", "250"))
+LIVE_PUBLISH_BUFFER = int(os.getenv("LIVE_PUBLISH_BUFFER", "10000"))
+
+# Attempts this recent are reported by the seed query, so events that arrive
+# while a quiz is being seeded are counted exactly once
+_SEED_OVERLAP = timedelta(seconds=60)
+
+# NOTIFY payloads must stay below 8000 bytes
+_NOTIFY_PAYLOAD_LIMIT = 7500
+
+# Queued in place of further events once a subscriber has been dropped
+DROPPED = object()
+
+
+class EventPublisher:
+    """Per-worker queue of live events, sent as batched NOTIFYs by ``run``."""
+
+    def __init__(self):
+        # Appended to from threadpool threads; deque appends and pops are thread-safe
+        self._pending = deque(maxlen=LIVE_PUBLISH_BUFFER)
+
+    def publish(self, event: dict) -> None:
+        self._pending.append(json.dumps(event))
+
+    def _batches(self) -> list:
+        """Drain the queue into JSON array payloads that fit in one NOTIFY each."""
+        batches, batch, size = [], [], 2
+        while self._pending:
+            event = self._pending.popleft()
+            if batch and size + len(event) + 1 > _NOTIFY_PAYLOAD_LIMIT:
+                batches.append(batch)
+                batch, size = [], 2
+            batch.append(event)
+            size += len(event) + 1
+        if batch:
+            batches.append(batch)
+        return ["[" + ",".join(batch) + "]" for batch in batches]
+
+    def _send(self, payloads: list) -> None:
+        with engine.connect() as connection:
+            for payload in payloads:
+                connection.execute(select(func.pg_notify(LIVE_CHANNEL, payload)))
+            connection.commit()
+
+    async def flush(self) -> None:
+        payloads = self._batches()
+        if not payloads:
+            return
+        try:
+            await run_in_threadpool(self._send, payloads)
+        except Exception:
+            # Live events are best effort; dashboards reseed their averages on reconnect
+            logger.exception("Could not publish %d live result batches", len(payloads))
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(LIVE_PUBLISH_INTERVAL_MS / 1000)
+            await self.flush()
+
+
+publisher = EventPublisher()
+
+
+def publish_attempt(attempt: QuizAttempt) -> None:
+    """Queue a live event for a committed ``attempt``; sent with the worker's next batch."""
+    publisher.publish({
+        "quiz_id": str(attempt.quiz_id),
+        "attempt_id": str(attempt.id),
+        "user_name": attempt.user_name,
+        "score": attempt.score,
+        "total_points": attempt.total_points,
+        "percentage": float(attempt.percentage),
+        "submitted_at": attempt.submitted_at.isoformat(),
+    })
+
+
+class _QuizStats:
+    def __init__(self, attempt_count: int, percentage_sum: float):
+        self.attempt_count = attempt_count
+        self.percentage_sum = percentage_sum
+
+    def add(self, percentage: float) -> None:
+        self.attempt_count += 1
+        self.percentage_sum += percentage
+
+    def as_dict(self) -> dict:
+        average = self.percentage_sum / self.attempt_count if self.attempt_count else 0.0
+        return {"attempt_count": self.attempt_count, "average_percentage": round(average, 2)}
+
+
+def _open_listen_connection():
+    """Open the autocommit LISTEN connection; blocking, so it runs in the threadpool."""
+    connection = psycopg2.connect(
+        engine.url.set(drivername="postgresql").render_as_string(hide_password=False),
+        connect_timeout=LIVE_CONNECT_TIMEOUT_SECONDS
+    )
+    try:
+        connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {LIVE_CHANNEL}")
+    except psycopg2.Error:
+        connection.close()
+        raise
+    return connection
+
+
+def quiz_exists(quiz_id: UUID) -> bool:
+    db = SessionLocal()
+    try:
+        return db.scalar(select(Quiz.id).where(Quiz.id == quiz_id)) is not None
+    finally:
+        db.close()
+
+
+def _load_stats(quiz_id: UUID) -> tuple:
+    """Stats of a quiz, plus the ids of its recent attempts that they already include."""
+    db = SessionLocal()
+    try:
+        attempt_count, percentage_sum, recent_ids = db.execute(
+            select(
+                func.count(QuizAttempt.id),
+                func.coalesce(func.sum(QuizAttempt.percentage), 0),
+                func.array_agg(QuizAttempt.id).filter(QuizAttempt.submitted_at >= func.now() - _SEED_OVERLAP),
+            )
+            .where(QuizAttempt.quiz_id == quiz_id)
+        ).one()
+        return _QuizStats(attempt_count, float(percentage_sum)), {str(attempt_id) for attempt_id in recent_ids or []}
+    finally:
+        db.close()
+
+
+class Subscription:
+    def __init__(self, quiz_id: UUID):
+        self.quiz_id = quiz_id
+        self.snapshot = None
+        self.queue = asyncio.Queue(maxsize=LIVE_CLIENT_BUFFER)
+
+
+class QuizBroadcaster:
+    """Per-worker fan-out of live quiz events. Only used from the event loop thread."""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._stats = {}
+        self._seeding = {}
+        # Events received for a quiz while its stats are being (re)seeded
+        self._pending = {}
+        self._connection = None
+        self._fileno = None
+        self._connecting = None
+        self._retry = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def subscribe(self, quiz_id: UUID) -> Subscription:
+        await self._ensure_listening()
+        # Registered before seeding, so attempts committed meanwhile are buffered, not dropped
+        subscription = Subscription(quiz_id)
+        self._subscriptions.setdefault(quiz_id, set()).add(subscription)
+        try:
+            if quiz_id not in self._stats:
+                await self._seed_stats(quiz_id)
+        except BaseException:
+            self.unsubscribe(subscription)
+            raise
+
+        subscription.snapshot = self._stats[quiz_id].as_dict()
+        return subscription
+
+    async def _seed_stats(self, quiz_id: UUID) -> None:
+        if quiz_id not in self._seeding:
+            self._pending.setdefault(quiz_id, [])
+            self._seeding[quiz_id] = asyncio.ensure_future(self._seed(quiz_id))
+        await asyncio.shield(self._seeding[quiz_id])
+
+    async def _seed(self, quiz_id: UUID) -> None:
+        try:
+            stats, counted_ids = await run_in_threadpool(_load_stats, quiz_id)
+        finally:
+            self._seeding.pop(quiz_id, None)
+            pending = self._pending.pop(quiz_id, [])
+        if quiz_id not in self._subscriptions:
+            return
+
+        self._stats[quiz_id] = stats
+        for event in pending:
+            self._deliver(quiz_id, event, counted=event["attempt_id"] in counted_ids)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscriptions.get(subscription.quiz_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            # Nobody watches this quiz here any more; reseed on the next subscription
+            del self._subscriptions[subscription.quiz_id]
+            self._stats.pop(subscription.quiz_id, None)
+
+    def _fan_out(self, event: dict) -> None:
+        quiz_id = UUID(event["quiz_id"])
+        if quiz_id in self._pending:
+            self._pending[quiz_id].append(event)
+            return
+        self._deliver(quiz_id, event)
+
+    def _deliver(self, quiz_id: UUID, event: dict, counted: bool = False) -> None:
+        subscribers = self._subscriptions.get(quiz_id)
+        if not subscribers:
+            return
+
+        stats = self._stats.get(quiz_id)
+        if stats is not None:
+            if not counted:
+                stats.add(event["percentage"])
+            event.update(stats.as_dict())
+
+        for subscription in list(subscribers):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.info("Dropping slow live results subscriber for quiz %s", quiz_id)
+                subscribers.discard(subscription)
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.queue.put_nowait(DROPPED)
+
+    # LISTEN connection
+    async def _ensure_listening(self) -> None:
+        if self._connection is not None or self._retry is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        # Concurrent subscribers share one connection attempt
+        if self._connecting is None:
+            self._connecting = self._loop.create_task(self._connect())
+        await asyncio.shield(self._connecting)
+
+    async def _connect(self) -> None:
+        try:
+            connection = await run_in_threadpool(_open_listen_connection)
+        except psycopg2.Error:
+            logger.exception("Could not listen for live results, retrying in %ds", LIVE_RECONNECT_SECONDS)
+            self._retry = self._loop.call_later(LIVE_RECONNECT_SECONDS, self._reconnect)
+            return
+        finally:
+            self._connecting = None
+
+        # Only the watching happens on the loop; the socket is read when notifications arrive
+        self._connection = connection
+        self._fileno = connection.fileno()
+        self._loop.add_reader(self._fileno, self._on_notify)
+
+    def _reconnect(self) -> None:
+        self._retry = None
+        if self._subscriptions:
+            self._loop.create_task(self._resume_listening())
+
+    async def _resume_listening(self) -> None:
+        await self._ensure_listening()
+        if self._connection is not None:
+            # Events were missed while disconnected, so the running averages are reseeded
+            self._stats.clear()
+            for quiz_id in list(self._subscriptions):
+                self._loop.create_task(self._seed_stats(quiz_id))
+
+    def _on_notify(self) -> None:
+        try:
+            self._connection.poll()
+        except psycopg2.Error:
+            logger.exception("Live results connection lost, reconnecting in %ds", LIVE_RECONNECT_SECONDS)
+            self.close()
+            self._retry = self._loop.call_later(LIVE_RECONNECT_SECONDS, self._reconnect)
+            return
+
+        while self._connection.notifies:
+            notify = self._connection.notifies.pop(0)
+            for event in json.loads(notify.payload):
+                self._fan_out(event)
+
+    def close(self) -> None:
+        if self._connecting is not None:
+            self._connecting.cancel()
+            self._connecting = None
+        if self._connection is None:
+            return
+        self._loop.remove_reader(self._fileno)
+        self._connection.close()
+        self._connection = None
+        self._fileno = None
+
+
+broadcaster = QuizBroadcaster()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_events(subscription: Subscription):
+    """Server-sent events for one subscriber: a snapshot, then one event per new attempt."""
+    try:
+        yield _sse("snapshot", subscription.snapshot)
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), LIVE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            if event is DROPPED:
+                yield _sse("dropped", {"detail": "Client fell too far behind; reconnect to resume"})
+                return
+            yield _sse("attempt", event)
+    finally:
+        broadcaster.unsubscribe(subscription)
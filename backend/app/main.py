@@ -1,16 +1,44 @@
+import time
+
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
+from fastapi.responses import JSONResponse
+from app.database import engine
+from app.live import broadcaster, publisher
+from app.profiling import PROFILING_ENABLED, ProfilingMiddleware, install_sql_timing
 from app.routers import admin, public, auth
+from app.startup import FirstRequestTimer, maintain_partitions, report_warm_up, state, warm_up
 import os
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+state.import_started = _import_started
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # No schema work or DB round trip here: the worker serves /health immediately
+    # and warms up in the background until /ready turns green
+    warm_up_task = asyncio.create_task(warm_up())
+    warm_up_task.add_done_callback(report_warm_up)
+    publisher_task = asyncio.create_task(publisher.run())
+    partitions_task = asyncio.create_task(maintain_partitions())
+    yield
+    warm_up_task.cancel()
+    publisher_task.cancel()
+    partitions_task.cancel()
+    await publisher.flush()
+    broadcaster.close()
+    engine.dispose()
+
 
 app = FastAPI(
     title="Quiz Management System API",
     description="A production-ready quiz management system with admin and public endpoints",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS configuration - environment-aware
@@ -38,6 +66,14 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Records import-to-first-request time, reported by /ready
+app.add_middleware(FirstRequestTimer)
+
+# Opt-in request profiling; nothing is installed when disabled
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+    install_sql_timing(engine)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(admin.router)
@@ -57,3 +93,16 @@ def root():
 def health_check():
     return {"status": "healthy"}
 
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe: 503 until the worker has finished warming up."""
+    if state.warm_up_error:
+        return JSONResponse(status_code=503, content={"status": "failed", "detail": state.warm_up_error})
+    if not state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {
+        "status": "ready",
+        "import_to_ready_ms": state.import_to_ready_ms,
+        "import_to_first_request_ms": state.import_to_first_request_ms
+    }
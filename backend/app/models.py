@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Integer, Text, Boolean, ForeignKey, Numeric, DateTime, Enum as SQLEnum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Integer, Text, Boolean, ForeignKey, ForeignKeyConstraint, Index, Numeric, DateTime, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
@@ -57,6 +57,12 @@ class QuestionOption(Base):
 
 class QuizAttempt(Base):
     __tablename__ = "quiz_attempts"
+    __table_args__ = (
+        # Serves the (submitted_at, id) keyset walks over one quiz: an ordered scan per partition
+        Index("ix_quiz_attempts_quiz_submitted", "quiz_id", "submitted_at", "id"),
+        # Monthly range partitions are managed by app.partitions
+        {"postgresql_partition_by": "RANGE (submitted_at)"},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     quiz_id = Column(UUID(as_uuid=True), ForeignKey("quizzes.id"), nullable=False)
@@ -64,7 +70,10 @@ class QuizAttempt(Base):
     score = Column(Integer, nullable=False)
     total_points = Column(Integer, nullable=False)
     percentage = Column(Numeric(5, 2), nullable=False)
-    submitted_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Partition key, so it has to be part of the primary key
+    submitted_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    # All answers packed into one value when RESPONSE_STORAGE_MODE=packed; see app.response_store
+    packed_responses = Column(JSONB, nullable=True)
 
     quiz = relationship("Quiz")
     responses = relationship("QuizResponse", back_populates="attempt", cascade="all, delete-orphan")
@@ -72,14 +81,54 @@ class QuizAttempt(Base):
 
 class QuizResponse(Base):
     __tablename__ = "quiz_responses"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["attempt_id", "submitted_at"],
+            ["quiz_attempts.id", "quiz_attempts.submitted_at"],
+            ondelete="CASCADE"
+        ),
+        {"postgresql_partition_by": "RANGE (submitted_at)"},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    attempt_id = Column(UUID(as_uuid=True), ForeignKey("quiz_attempts.id", ondelete="CASCADE"), nullable=False)
+    attempt_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    submitted_at = Column(DateTime(timezone=True), primary_key=True)  # Copied from the attempt
     question_id = Column(UUID(as_uuid=True), ForeignKey("questions.id"), nullable=False)
-    selected_option_id = Column(UUID(as_uuid=True), ForeignKey("question_options.id"), nullable=True)
+    # Indexed for clearing removed options and for the foreign key check when an option is deleted
+    selected_option_id = Column(UUID(as_uuid=True), ForeignKey("question_options.id"), nullable=True, index=True)
     text_response = Column(Text, nullable=True)
     is_correct = Column(Boolean, nullable=False)
     points_earned = Column(Integer, nullable=False)
 
     attempt = relationship("QuizAttempt", back_populates="responses")
 
+
+
+class RegradeJobStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class RegradeJob(Base):
+    __tablename__ = "regrade_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    quiz_id = Column(UUID(as_uuid=True), ForeignKey("quizzes.id", ondelete="CASCADE"), nullable=False)
+    status = Column(SQLEnum(RegradeJobStatus), default=RegradeJobStatus.PENDING, nullable=False)
+    # Questions whose answer key changed; answers to other questions keep their stored grade
+    question_ids = Column(ARRAY(UUID(as_uuid=True)), nullable=False)
+    total_attempts = Column(Integer, default=0, nullable=False)
+    processed_attempts = Column(Integer, default=0, nullable=False)
+    responses_updated = Column(Integer, default=0, nullable=False)
+    attempts_updated = Column(Integer, default=0, nullable=False)
+    # Keyset cursor for resuming, in (submitted_at, id) order so chunks stay within few partitions
+    last_submitted_at = Column(DateTime(timezone=True), nullable=True)
+    last_attempt_id = Column(UUID(as_uuid=True), nullable=True)
+    # Runner currently holding the job; the lease is renewed through updated_at after every chunk
+    lease_owner = Column(UUID(as_uuid=True), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
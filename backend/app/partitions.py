@@ -0,0 +1,264 @@
+"""Monthly range partitions for quiz_attempts and quiz_responses.
+
+Both tables are partitioned by ``submitted_at`` with one partition per calendar
+month (UTC), named ``<table>_yYYYYmMM``, plus a DEFAULT partition that only
+catches rows no monthly partition covers. Future partitions are created by
+every worker during warm-up and then every ``PARTITION_CHECK_MINUTES``
+(``app.startup``), at schema setup (``app.schema``), and by the ``ensure``
+command. Rows the DEFAULT partitions already hold for a month that gets
+its own partition are moved into it when the partition is created.
+
+Cold months are archived by detaching their partitions, exporting them to
+gzip-compressed CSV on local disk and dropping the detached tables:
+
+    python -m app.partitions ensure --months-ahead 3
+    python -m app.partitions archive --older-than-months 12 --dest /var/lib/quiz/archive
+    python -m app.partitions convert   # one-off, for databases created before partitioning
+"""
+import argparse
+import gzip
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.database import engine as default_engine
+from app.models import QuizAttempt, QuizResponse as QuizResponseModel
+
+logger = logging.getLogger(__name__)
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+# Responses reference attempts, so they are created after and archived before them
+PARTITIONED_TABLES = ["quiz_attempts", "quiz_responses"]
+
+# Serializes partition DDL between workers booting at the same time
+_PARTITION_LOCK_ID = 727001
+
+_PARTITION_NAME = re.compile(r"^(?P<table>\w+)_y(?P<year>\d{4})m(?P<month>\d{2})$")
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _current_month() -> date:
+    today = datetime.now(timezone.utc).date()
+    return date(today.year, today.month, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def _month_bounds(month: date) -> dict:
+    return {
+        "start": datetime(month.year, month.month, 1, tzinfo=timezone.utc),
+        "end": datetime.combine(_add_months(month, 1), datetime.min.time(), tzinfo=timezone.utc),
+    }
+
+
+def _table_exists(conn: Connection, name: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+
+
+def _create_month(conn: Connection, tables: list, month: date) -> None:
+    """Create the month's partition of each of ``tables``.
+
+    Postgres refuses to create a partition while the DEFAULT partition holds rows
+    for its range, so those rows are stashed in temporary tables first and
+    re-inserted through the parent once the partition exists. Responses are
+    stashed before the attempts they reference and restored after them.
+    """
+    missing = [table for table in tables if not _table_exists(conn, partition_name(table, month))]
+    if "quiz_attempts" in missing and "quiz_responses" not in missing:
+        # Moving the attempts out of DEFAULT would cascade-delete their responses
+        raise RuntimeError(
+            f"{partition_name('quiz_responses', month)} exists without {partition_name('quiz_attempts', month)}; "
+            "create the attempts partition manually"
+        )
+
+    bounds = _month_bounds(month)
+    stashed = {}
+    for table in reversed(missing):
+        stash = f"{table}_stash"
+        conn.execute(text(f"CREATE TEMPORARY TABLE {stash} (LIKE {table}_default) ON COMMIT DROP"))
+        stashed[table] = conn.execute(text(
+            f"WITH moved AS (DELETE FROM {table}_default "
+            f"WHERE submitted_at >= :start AND submitted_at < :end RETURNING *) "
+            f"INSERT INTO {stash} SELECT * FROM moved"
+        ), bounds).rowcount
+
+    for table in missing:
+        conn.execute(text(
+            f"CREATE TABLE {partition_name(table, month)} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+            f"TO ('{_add_months(month, 1).isoformat()} 00:00:00+00')"
+        ))
+        if stashed[table]:
+            conn.execute(text(f"INSERT INTO {table} SELECT * FROM {table}_stash"))
+            logger.info("Moved %d rows of %s from the DEFAULT partition into %s",
+                        stashed[table], table, partition_name(table, month))
+        conn.execute(text(f"DROP TABLE {table}_stash"))
+
+
+def _is_partitioned(conn: Connection, table: str) -> bool:
+    relkind = conn.execute(text("SELECT relkind FROM pg_class WHERE relname = :table"), {"table": table}).scalar()
+    return relkind == "p"
+
+
+def _ensure(conn: Connection, start: date, end: date) -> None:
+    conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": _PARTITION_LOCK_ID})
+    tables = []
+    for table in PARTITIONED_TABLES:
+        if not _is_partitioned(conn, table):
+            logger.warning("%s is not partitioned; run `python -m app.partitions convert`", table)
+            continue
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+        tables.append(table)
+
+    month = start
+    while month <= end:
+        _create_month(conn, tables, month)
+        month = _add_months(month, 1)
+
+
+def ensure_partitions(bind: Engine = default_engine, months_ahead: int = PARTITION_MONTHS_AHEAD) -> None:
+    """Create the DEFAULT partitions and monthly partitions up to ``months_ahead`` months out."""
+    with bind.begin() as conn:
+        _ensure(conn, _current_month(), _add_months(_current_month(), months_ahead))
+
+
+def list_partitions(conn: Connection, table: str) -> list:
+    """Return ``(name, month, attached)`` for each monthly partition table of ``table``, oldest first.
+
+    Partitions left detached by an interrupted archive run are included with ``attached=False``.
+    """
+    rows = conn.execute(text(
+        "SELECT relname, relispartition FROM pg_class WHERE relkind = 'r' AND relname LIKE :pattern"
+    ), {"pattern": f"{table}_y%"}).all()
+
+    partitions = []
+    for name, attached in rows:
+        match = _PARTITION_NAME.match(name)
+        if match and match.group("table") == table:
+            month = date(int(match.group("year")), int(match.group("month")), 1)
+            partitions.append((name, month, attached))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def _export_table(bind: Engine, table_name: str, path: str) -> None:
+    raw = bind.raw_connection()
+    try:
+        with gzip.open(path, "wb") as archive, raw.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table_name} TO STDOUT WITH (FORMAT csv, HEADER true)", archive)
+    finally:
+        raw.close()
+
+
+def archive_partitions(dest: str, older_than_months: int, bind: Engine = default_engine) -> list:
+    """Detach, export and drop monthly partitions that ended more than ``older_than_months`` ago.
+
+    Each partition is detached, written to ``<dest>/<partition>.csv.gz`` and only
+    dropped once the export has succeeded, so a failed run can simply be repeated.
+    Returns the archive file paths.
+    """
+    os.makedirs(dest, exist_ok=True)
+    cutoff = _add_months(_current_month(), -older_than_months)
+    with bind.connect() as conn:
+        partitions = {
+            (table, month): (name, attached) for table in PARTITIONED_TABLES
+            for name, month, attached in list_partitions(conn, table) if month < cutoff
+        }
+
+    archived = []
+    for month in sorted({month for _, month in partitions}):
+        for table in reversed(PARTITIONED_TABLES):
+            if (table, month) not in partitions:
+                continue
+            name, attached = partitions[(table, month)]
+            if attached:
+                with bind.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+
+            path = os.path.join(dest, f"{name}.csv.gz")
+            _export_table(bind, name, path)
+            with bind.begin() as conn:
+                conn.execute(text(f"DROP TABLE {name}"))
+
+            logger.info("Archived partition %s to %s", name, path)
+            archived.append(path)
+    return archived
+
+
+def convert_to_partitioned(bind: Engine = default_engine) -> bool:
+    """Rebuild plain quiz_attempts/quiz_responses tables as partitioned ones, in one transaction.
+
+    Returns False when the tables are already partitioned.
+    """
+    with bind.begin() as conn:
+        if _is_partitioned(conn, "quiz_attempts"):
+            return False
+
+        for table in reversed(PARTITIONED_TABLES):
+            conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned"))
+            conn.execute(text(f"ALTER INDEX {table}_pkey RENAME TO {table}_unpartitioned_pkey"))
+        QuizAttempt.__table__.create(conn)
+        QuizResponseModel.__table__.create(conn)
+
+        # submitted_at becomes part of the primary key, so it can no longer be NULL
+        conn.execute(text("UPDATE quiz_attempts_unpartitioned SET submitted_at = now() WHERE submitted_at IS NULL"))
+        oldest = conn.execute(text(
+            "SELECT date_trunc('month', min(submitted_at) AT TIME ZONE 'UTC') FROM quiz_attempts_unpartitioned"
+        )).scalar()
+        _ensure(conn, oldest.date() if oldest else _current_month(), _add_months(_current_month(), PARTITION_MONTHS_AHEAD))
+
+        conn.execute(text(
+            "INSERT INTO quiz_attempts (id, quiz_id, user_name, score, total_points, percentage, submitted_at) "
+            "SELECT id, quiz_id, user_name, score, total_points, percentage, submitted_at "
+            "FROM quiz_attempts_unpartitioned"
+        ))
+        conn.execute(text(
+            "INSERT INTO quiz_responses (id, attempt_id, submitted_at, question_id, selected_option_id, "
+            "text_response, is_correct, points_earned) "
+            "SELECT r.id, r.attempt_id, a.submitted_at, r.question_id, r.selected_option_id, "
+            "r.text_response, r.is_correct, r.points_earned "
+            "FROM quiz_responses_unpartitioned r JOIN quiz_attempts_unpartitioned a ON a.id = r.attempt_id"
+        ))
+        conn.execute(text("DROP TABLE quiz_responses_unpartitioned"))
+        conn.execute(text("DROP TABLE quiz_attempts_unpartitioned"))
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage quiz attempt partitions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ensure_parser = subparsers.add_parser("ensure", help="Create upcoming monthly partitions")
+    ensure_parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+
+    archive_parser = subparsers.add_parser("archive", help="Detach and export old partitions")
+    archive_parser.add_argument("--older-than-months", type=int, required=True)
+    archive_parser.add_argument("--dest", required=True)
+
+    subparsers.add_parser("convert", help="Convert unpartitioned tables to partitioned ones")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "ensure":
+        ensure_partitions(months_ahead=args.months_ahead)
+    elif args.command == "archive":
+        for path in archive_partitions(args.dest, args.older_than_months):
+            print(path)
+    elif args.command == "convert":
+        if not convert_to_partitioned():
+            print("Tables are already partitioned")
+
+
+if __name__ == "__main__":
+    main()
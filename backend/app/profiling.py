@@ -0,0 +1,229 @@
+"""Opt-in request profiling for live workers.
+
+When ``PROFILING_ENABLED=true``, ``ProfilingMiddleware`` profiles a random
+``PROFILE_SAMPLE_RATE`` fraction of requests, plus any request that carries a
+valid admin token in the ``X-Profile-Token`` header. For a profiled request:
+
+* a background thread samples the stack of the thread running the endpoint
+  every ``PROFILE_SAMPLE_INTERVAL_MS`` and aggregates the samples as collapsed
+  stacks (the input format of flamegraph tools);
+* SQLAlchemy engine events add up the time spent executing SQL, which is split
+  from the remaining (Python) time of the request.
+
+The last ``PROFILE_BUFFER_SIZE`` profiles of each worker are kept in memory and
+served by the admin ``/api/admin/profiles`` endpoints. When profiling is
+disabled neither the middleware nor the engine listeners are installed and
+``ProfiledRoute`` registers endpoints unchanged.
+"""
+import asyncio
+import functools
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.auth import is_admin_token
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_HEADER = b"x-profile-token"
+
+_MAX_STACK_DEPTH = 64
+
+_current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+profiles = deque(maxlen=PROFILE_BUFFER_SIZE)
+
+
+@dataclass
+class RequestProfile:
+    method: str
+    path: str
+    id: uuid.UUID = field(default_factory=uuid.uuid4)
+    started_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    status_code: Optional[int] = None
+    wall_ms: float = 0.0
+    sql_ms: float = 0.0
+    sql_count: int = 0
+    stacks: Counter = field(default_factory=Counter)
+
+    @property
+    def python_ms(self) -> float:
+        return max(self.wall_ms - self.sql_ms, 0.0)
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> str:
+        """Samples as ``frame;frame;frame count`` lines, root frame first."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < _MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class _StackSampler:
+    """Samples the stacks of the threads currently running profiled endpoints."""
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+    def attach(self, thread_id: int, profile: RequestProfile) -> None:
+        with self._lock:
+            self._threads[thread_id] = profile
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._worker.start()
+        self._wakeup.set()
+
+    def detach(self, thread_id: int) -> None:
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                targets = dict(self._threads)
+            if not targets:
+                # Idle until the next profiled request instead of polling
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            frames = sys._current_frames()
+            for thread_id, profile in targets.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.stacks[_collapse(frame)] += 1
+            del frames
+            time.sleep(self._interval)
+
+
+_sampler = _StackSampler(PROFILE_SAMPLE_INTERVAL_MS / 1000)
+
+
+def _sampled(endpoint):
+    """Wrap an endpoint so the thread executing it is sampled while a profile is active."""
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def sampled_endpoint(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            thread_id = threading.get_ident()
+            _sampler.attach(thread_id, profile)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _sampler.detach(thread_id)
+    else:
+        @functools.wraps(endpoint)
+        def sampled_endpoint(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return endpoint(*args, **kwargs)
+            thread_id = threading.get_ident()
+            _sampler.attach(thread_id, profile)
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _sampler.detach(thread_id)
+    sampled_endpoint._profiled = True
+    return sampled_endpoint
+
+
+class ProfiledRoute(APIRoute):
+    """Route class that lets the sampler find the (threadpool) thread running the endpoint."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        # include_router builds the route again from the already wrapped endpoint
+        if PROFILING_ENABLED and not getattr(endpoint, "_profiled", False):
+            endpoint = _sampled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def install_sql_timing(engine: Engine) -> None:
+    """Add the SQL execution time of profiled requests to their profile."""
+
+    # The start time lives on the execution context, so a failed statement leaves nothing behind
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and _current_profile.get() is not None:
+            context._profile_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        started = getattr(context, "_profile_query_start", None)
+        if profile is not None and started is not None:
+            profile.sql_ms += (time.perf_counter() - started) * 1000
+            profile.sql_count += 1
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that decides which requests are profiled and records their profile."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _should_profile(self, scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return is_admin_token(value.decode("latin-1"))
+        return random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(method=scope["method"], path=scope["path"])
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+            await send(message)
+
+        token = _current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            profile.wall_ms = (time.perf_counter() - started) * 1000
+            _current_profile.reset(token)
+            profiles.append(profile)
+
+
+def get_profile(profile_id: uuid.UUID) -> Optional[RequestProfile]:
+    for profile in list(profiles):
+        if profile.id == profile_id:
+            return profile
+    return None
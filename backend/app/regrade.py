@@ -0,0 +1,354 @@
+"""Bulk regrading of stored quiz attempts after an answer key change.
+
+A job only regrades the answers to the questions it was started for (the ones
+whose key changed); all other stored grades are kept as they are. Responses are regraded with one set-based UPDATE per chunk and attempts are
+re-aggregated with one grouped UPDATE per chunk, so no attempt is ever loaded
+into Python. Chunks are walked in (submitted_at, id) order and every statement
+is bounded by the chunk's submitted_at range, so Postgres only touches the
+partitions the chunk lives in. Attempts stored in the packed layout are
+regraded by rebuilding their JSONB array in SQL. Text answers are matched in
+Python with submit_quiz's own comparison, once per distinct answer in a chunk,
+because Postgres' btrim()/lower() do not agree with str.strip()/str.lower()
+on Unicode whitespace and case. The cursor is committed
+together with each chunk's updates, which makes an interrupted job resumable.
+
+A runner claims a job atomically and holds it through a lease renewed with
+every chunk; a job whose runner died can be claimed again once the lease has
+expired, and a runner that lost its lease stops without committing.
+"""
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from sqlalchemy import Integer, and_, case, cast, func, or_, select, true, tuple_, update, Numeric
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, aggregate_order_by
+from sqlalchemy.orm import Session, aliased
+
+from app.database import SessionLocal
+from app.models import (
+    Question, QuestionOption, QuestionType, QuizAttempt,
+    QuizResponse as QuizResponseModel, RegradeJob, RegradeJobStatus
+)
+from app.response_store import packed_elements
+from app.routers.public import text_answer_is_correct
+
+logger = logging.getLogger(__name__)
+
+REGRADE_CHUNK_SIZE = int(os.getenv("REGRADE_CHUNK_SIZE", "1000"))
+REGRADE_LEASE_SECONDS = int(os.getenv("REGRADE_LEASE_SECONDS", "300"))
+
+def _correct_text_answers(db: Session, answers) -> list:
+    """The ``(question_id, text)`` pairs of ``answers`` that submit_quiz accepts.
+
+    ``answers`` selects distinct ``(question_id, text, correct_answer_text)`` rows.
+    """
+    return [
+        (question_id, text_response)
+        for question_id, text_response, correct_answer_text in db.execute(answers)
+        if text_answer_is_correct(text_response, correct_answer_text)
+    ]
+
+
+def _is_correct(text_correct):
+    """Grading rule of submit_quiz, over Question, the joined QuestionOption and ``text_correct``."""
+    return case(
+        (
+            Question.question_type.in_([QuestionType.MCQ, QuestionType.TRUE_FALSE]),
+            func.coalesce(QuestionOption.is_correct, False),
+        ),
+        (Question.question_type == QuestionType.TEXT, func.coalesce(text_correct, False)),
+        else_=False,
+    )
+
+
+def _percentage(score, total_points):
+    return case(
+        (total_points > 0, func.round(cast(score, Numeric) * 100 / total_points, 2)),
+        else_=0,
+    )
+
+
+def regrade_responses(
+    db: Session, attempt_ids: list, submitted_from: datetime, submitted_to: datetime, question_ids: list
+) -> int:
+    """Recompute is_correct/points_earned for the given attempts' responses to ``question_ids``."""
+    in_chunk = (
+        QuizResponseModel.attempt_id.in_(attempt_ids),
+        QuizResponseModel.submitted_at.between(submitted_from, submitted_to),
+        QuizResponseModel.question_id.in_(question_ids),
+    )
+    correct_text = _correct_text_answers(db, (
+        select(QuizResponseModel.question_id, QuizResponseModel.text_response, Question.correct_answer_text)
+        .distinct()
+        .join(Question, Question.id == QuizResponseModel.question_id)
+        .where(*in_chunk, Question.question_type == QuestionType.TEXT)
+    ))
+    text_correct = tuple_(QuizResponseModel.question_id, QuizResponseModel.text_response).in_(correct_text)
+    graded = (
+        select(
+            QuizResponseModel.id.label("response_id"),
+            Question.points.label("points"),
+            _is_correct(text_correct).label("is_correct"),
+        )
+        .select_from(QuizResponseModel)
+        .join(Question, Question.id == QuizResponseModel.question_id)
+        .outerjoin(
+            QuestionOption,
+            and_(
+                QuestionOption.id == QuizResponseModel.selected_option_id,
+                QuestionOption.question_id == QuizResponseModel.question_id,
+            ),
+        )
+        .where(*in_chunk)
+        .subquery()
+    )
+    points_earned = case((graded.c.is_correct, graded.c.points), else_=0)
+
+    stmt = (
+        update(QuizResponseModel)
+        .where(QuizResponseModel.id == graded.c.response_id)
+        .where(QuizResponseModel.submitted_at.between(submitted_from, submitted_to))
+        .where(
+            QuizResponseModel.is_correct.is_distinct_from(graded.c.is_correct)
+            | QuizResponseModel.points_earned.is_distinct_from(points_earned)
+        )
+        .values(is_correct=graded.c.is_correct, points_earned=points_earned)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).rowcount
+
+
+def regrade_attempts(db: Session, attempt_ids: list, submitted_from: datetime, submitted_to: datetime) -> int:
+    """Re-aggregate score, total_points and percentage from the stored responses."""
+    totals = (
+        select(
+            QuizResponseModel.attempt_id.label("attempt_id"),
+            func.coalesce(func.sum(QuizResponseModel.points_earned), 0).label("score"),
+            func.coalesce(func.sum(Question.points), 0).label("total_points"),
+        )
+        .join(Question, Question.id == QuizResponseModel.question_id)
+        .where(QuizResponseModel.attempt_id.in_(attempt_ids))
+        .where(QuizResponseModel.submitted_at.between(submitted_from, submitted_to))
+        .group_by(QuizResponseModel.attempt_id)
+        .subquery()
+    )
+    percentage = _percentage(totals.c.score, totals.c.total_points)
+
+    stmt = (
+        update(QuizAttempt)
+        .where(QuizAttempt.id == totals.c.attempt_id)
+        .where(QuizAttempt.submitted_at.between(submitted_from, submitted_to))
+        .where(
+            QuizAttempt.score.is_distinct_from(totals.c.score)
+            | QuizAttempt.total_points.is_distinct_from(totals.c.total_points)
+            | QuizAttempt.percentage.is_distinct_from(percentage)
+        )
+        .values(score=totals.c.score, total_points=totals.c.total_points, percentage=percentage)
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).rowcount
+
+
+def regrade_packed_attempts(
+    db: Session, attempt_ids: list, submitted_from: datetime, submitted_to: datetime, question_ids: list
+) -> int:
+    """Regrade attempts stored in the packed layout, rebuilding packed_responses and the totals.
+
+    Only answers to ``question_ids`` are regraded; the others keep their stored
+    grade. Answers to questions that no longer exist are kept unchanged in the
+    array and, as in regrade_attempts, left out of score and total_points.
+    """
+    attempt = aliased(QuizAttempt)
+    elements = packed_elements(attempt)
+    element = elements.c.value
+    element_question_id = cast(element["q"].astext, PG_UUID(as_uuid=True))
+    in_chunk = (
+        attempt.id.in_(attempt_ids),
+        attempt.submitted_at.between(submitted_from, submitted_to),
+        attempt.packed_responses.isnot(None),
+    )
+    correct_text = _correct_text_answers(db, (
+        select(element_question_id, element["t"].astext, Question.correct_answer_text)
+        .distinct()
+        .select_from(attempt)
+        .join(elements, true())
+        .join(Question, Question.id == element_question_id)
+        .where(*in_chunk, Question.id.in_(question_ids), Question.question_type == QuestionType.TEXT)
+    ))
+    is_correct = _is_correct(tuple_(element_question_id, element["t"].astext).in_(correct_text))
+    regraded = Question.id.in_(question_ids)
+    points_earned = case(
+        (Question.id.is_(None), 0),
+        (regraded, case((is_correct, Question.points), else_=0)),
+        else_=cast(element["p"].astext, Integer),
+    )
+    regraded_element = case(
+        (regraded, func.jsonb_build_object(
+            "q", element["q"], "o", element["o"], "t", element["t"],
+            "c", is_correct, "p", points_earned
+        )),
+        else_=element,
+    )
+    graded = (
+        select(
+            attempt.id.label("attempt_id"),
+            func.jsonb_agg(aggregate_order_by(regraded_element, elements.c.ordinality)).label("packed"),
+            func.coalesce(func.sum(points_earned), 0).label("score"),
+            func.coalesce(func.sum(Question.points), 0).label("total_points"),
+        )
+        .select_from(attempt)
+        .join(elements, true())
+        .outerjoin(Question, Question.id == element_question_id)
+        .outerjoin(
+            QuestionOption,
+            and_(
+                QuestionOption.id == cast(element["o"].astext, PG_UUID(as_uuid=True)),
+                QuestionOption.question_id == Question.id,
+            ),
+        )
+        .where(*in_chunk)
+        .group_by(attempt.id)
+        .subquery()
+    )
+    percentage = _percentage(graded.c.score, graded.c.total_points)
+
+    stmt = (
+        update(QuizAttempt)
+        .where(QuizAttempt.id == graded.c.attempt_id)
+        .where(QuizAttempt.submitted_at.between(submitted_from, submitted_to))
+        .where(
+            QuizAttempt.packed_responses.is_distinct_from(graded.c.packed)
+            | QuizAttempt.score.is_distinct_from(graded.c.score)
+            | QuizAttempt.total_points.is_distinct_from(graded.c.total_points)
+            | QuizAttempt.percentage.is_distinct_from(percentage)
+        )
+        .values(
+            packed_responses=graded.c.packed, score=graded.c.score,
+            total_points=graded.c.total_points, percentage=percentage
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(stmt).rowcount
+
+
+def _lease_expired():
+    return RegradeJob.updated_at < func.now() - timedelta(seconds=REGRADE_LEASE_SECONDS)
+
+
+def job_is_held():
+    """Jobs that are queued or running under a live lease; they must not be started again."""
+    return and_(
+        RegradeJob.status.in_([RegradeJobStatus.PENDING, RegradeJobStatus.RUNNING]),
+        ~_lease_expired(),
+    )
+
+
+def job_is_claimable():
+    """Jobs a runner may take: queued, failed, or running under an expired lease."""
+    return or_(
+        RegradeJob.status.in_([RegradeJobStatus.PENDING, RegradeJobStatus.FAILED]),
+        and_(RegradeJob.status == RegradeJobStatus.RUNNING, _lease_expired()),
+    )
+
+
+class _LeaseLost(Exception):
+    pass
+
+
+def _update_owned_job(db: Session, job_id: UUID, owner: UUID, **values) -> None:
+    """Update the job only while ``owner`` still holds it and it is running; renews the lease."""
+    result = db.execute(
+        update(RegradeJob)
+        .where(
+            RegradeJob.id == job_id,
+            RegradeJob.lease_owner == owner,
+            RegradeJob.status == RegradeJobStatus.RUNNING,
+        )
+        .values(updated_at=func.now(), **values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        raise _LeaseLost()
+
+
+def _next_chunk(db: Session, quiz_id: UUID, cursor: tuple, chunk_size: int) -> list:
+    query = select(QuizAttempt.id, QuizAttempt.submitted_at).where(QuizAttempt.quiz_id == quiz_id)
+    if cursor[1] is not None:
+        # The plain bound lets Postgres prune finished partitions; the row comparison cannot
+        query = query.where(
+            QuizAttempt.submitted_at >= cursor[0],
+            tuple_(QuizAttempt.submitted_at, QuizAttempt.id) > tuple_(*cursor),
+        )
+    query = query.order_by(QuizAttempt.submitted_at, QuizAttempt.id).limit(chunk_size)
+    return db.execute(query).all()
+
+
+def run_regrade_job(job_id: UUID, chunk_size: int = REGRADE_CHUNK_SIZE) -> None:
+    """Claim and run (or resume) a regrade job in its own session, committing after every chunk."""
+    owner = uuid.uuid4()
+    db = SessionLocal()
+    try:
+        claimed = db.execute(
+            update(RegradeJob)
+            .where(RegradeJob.id == job_id, job_is_claimable())
+            .values(status=RegradeJobStatus.RUNNING, lease_owner=owner, error=None, updated_at=func.now())
+            .returning(
+                RegradeJob.quiz_id, RegradeJob.question_ids,
+                RegradeJob.last_submitted_at, RegradeJob.last_attempt_id
+            )
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.commit()
+        if claimed is None:
+            logger.info("Regrade %s is held by another runner or already finished", job_id)
+            return
+
+        quiz_id, question_ids = claimed.quiz_id, claimed.question_ids
+        cursor = (claimed.last_submitted_at, claimed.last_attempt_id)
+        if cursor[1] is None:
+            total_attempts = db.scalar(select(func.count(QuizAttempt.id)).where(QuizAttempt.quiz_id == quiz_id))
+            _update_owned_job(db, job_id, owner, total_attempts=total_attempts)
+            db.commit()
+
+        while True:
+            chunk = _next_chunk(db, quiz_id, cursor, chunk_size)
+            if not chunk:
+                break
+
+            attempt_ids = [row.id for row in chunk]
+            submitted_from, submitted_to = chunk[0].submitted_at, chunk[-1].submitted_at
+            responses_updated = regrade_responses(db, attempt_ids, submitted_from, submitted_to, question_ids)
+            attempts_updated = (
+                regrade_attempts(db, attempt_ids, submitted_from, submitted_to)
+                + regrade_packed_attempts(db, attempt_ids, submitted_from, submitted_to, question_ids)
+            )
+            cursor = (submitted_to, chunk[-1].id)
+            # Progress and the chunk's updates commit together, or not at all if the lease was lost
+            _update_owned_job(
+                db, job_id, owner,
+                responses_updated=RegradeJob.responses_updated + responses_updated,
+                attempts_updated=RegradeJob.attempts_updated + attempts_updated,
+                processed_attempts=RegradeJob.processed_attempts + len(chunk),
+                last_submitted_at=cursor[0],
+                last_attempt_id=cursor[1],
+            )
+            db.commit()
+            logger.info("Regrade %s: %d more attempts processed", job_id, len(chunk))
+
+        _update_owned_job(db, job_id, owner, status=RegradeJobStatus.COMPLETED, finished_at=func.now())
+        db.commit()
+    except _LeaseLost:
+        logger.warning("Regrade %s lost its lease to another runner; stopping", job_id)
+        db.rollback()
+    except Exception as exc:
+        logger.exception("Regrade %s failed", job_id)
+        db.rollback()
+        try:
+            _update_owned_job(db, job_id, owner, status=RegradeJobStatus.FAILED, error=str(exc))
+            db.commit()
+        except _LeaseLost:
+            db.rollback()
+    finally:
+        db.close()
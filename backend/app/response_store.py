@@ -0,0 +1,388 @@
+"""Storage of the per-question answers that belong to a quiz attempt.
+
+Two layouts are supported and may coexist in one database:
+
+* ``rows`` (default): one ``quiz_responses`` row per answered question.
+* ``packed``: all answers stored on ``quiz_attempts.packed_responses`` as a JSONB
+  array of ``{"q": question_id, "o": option_id, "t": text, "c": correct, "p": points}``,
+  so an attempt costs a single row and a single entry per index.
+
+``RESPONSE_STORAGE_MODE`` selects the layout for new submissions only. Reading
+code should go through ``get_attempt_responses``, which returns the same
+``ResponseView`` list for either layout. Existing attempts are moved between
+layouts, and the layouts compared, with:
+
+    python -m app.response_store migrate --to packed
+    python -m app.response_store benchmark --questions 100 --attempts 200   # scratch database only
+"""
+import argparse
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import (
+    Boolean, DateTime, Integer, case, cast, column, delete, func, insert, null, or_, select, table, text, true,
+    tuple_, update
+)
+from sqlalchemy.dialects.postgresql import JSONB, UUID as PG_UUID, aggregate_order_by
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import (
+    Question, QuestionOption, QuestionType, Quiz, QuizAttempt,
+    QuizResponse as QuizResponseModel
+)
+
+ROWS = "rows"
+PACKED = "packed"
+STORAGE_MODES = [ROWS, PACKED]
+
+RESPONSE_STORAGE_MODE = os.getenv("RESPONSE_STORAGE_MODE", ROWS)
+if RESPONSE_STORAGE_MODE not in STORAGE_MODES:
+    raise ValueError(f"RESPONSE_STORAGE_MODE must be one of {STORAGE_MODES}, got {RESPONSE_STORAGE_MODE!r}")
+
+
+@dataclass(frozen=True)
+class ResponseView:
+    question_id: UUID
+    selected_option_id: Optional[UUID]
+    text_response: Optional[str]
+    is_correct: bool
+    points_earned: int
+
+
+def pack_responses(responses: List[ResponseView]) -> list:
+    return [
+        {
+            "q": str(response.question_id),
+            "o": str(response.selected_option_id) if response.selected_option_id else None,
+            "t": response.text_response,
+            "c": response.is_correct,
+            "p": response.points_earned,
+        }
+        for response in responses
+    ]
+
+
+def unpack_responses(packed: list) -> List[ResponseView]:
+    return [
+        ResponseView(
+            question_id=UUID(item["q"]),
+            selected_option_id=UUID(item["o"]) if item["o"] else None,
+            text_response=item["t"],
+            is_correct=item["c"],
+            points_earned=item["p"],
+        )
+        for item in packed
+    ]
+
+
+def get_attempt_responses(attempt: QuizAttempt) -> List[ResponseView]:
+    """Per-response view of an attempt, whichever layout it is stored in."""
+    if attempt.packed_responses is not None:
+        return unpack_responses(attempt.packed_responses)
+    return [
+        ResponseView(
+            question_id=response.question_id,
+            selected_option_id=response.selected_option_id,
+            text_response=response.text_response,
+            is_correct=response.is_correct,
+            points_earned=response.points_earned,
+        )
+        for response in attempt.responses
+    ]
+
+
+def store_responses(attempt: QuizAttempt, responses: List[ResponseView], mode: str = None) -> None:
+    """Attach an attempt's responses before it is flushed.
+
+    Packed responses are then written by the attempt's own INSERT; response rows
+    get the attempt's key (including the server-generated submitted_at) at flush.
+    """
+    mode = mode or RESPONSE_STORAGE_MODE
+    if mode == PACKED:
+        attempt.packed_responses = pack_responses(responses)
+        return
+
+    for response in responses:
+        attempt.responses.append(QuizResponseModel(
+            question_id=response.question_id,
+            selected_option_id=response.selected_option_id,
+            text_response=response.text_response,
+            is_correct=response.is_correct,
+            points_earned=response.points_earned
+        ))
+
+
+def packed_elements(attempt=QuizAttempt):
+    """LATERAL ``jsonb_array_elements`` over ``attempt.packed_responses``, with ``value``/``ordinality`` columns."""
+    return (
+        func.jsonb_array_elements(attempt.packed_responses)
+        .table_valued(column("value", JSONB), with_ordinality="ordinality")
+        .lateral("packed_response")
+    )
+
+
+def clear_removed_options(db: Session, quiz_id: UUID, option_ids: list) -> None:
+    """Drop references to deleted options from the quiz's stored answers, in both layouts."""
+    db.execute(
+        update(QuizResponseModel).where(QuizResponseModel.selected_option_id.in_(option_ids))
+        .values(selected_option_id=None)
+        .execution_options(synchronize_session=False)
+    )
+
+    removed = [str(option_id) for option_id in option_ids]
+    elements = (
+        func.jsonb_array_elements(QuizAttempt.packed_responses)
+        .table_valued(column("value", JSONB), with_ordinality="ordinality")
+        .alias("packed_response")
+    )
+    element = elements.c.value
+    cleared = element.op("||", return_type=JSONB)(func.jsonb_build_object("o", null()))
+    repacked = select(func.jsonb_agg(aggregate_order_by(
+        case((element["o"].astext.in_(removed), cleared), else_=element),
+        elements.c.ordinality,
+    ))).scalar_subquery()
+    db.execute(
+        update(QuizAttempt)
+        .where(
+            QuizAttempt.quiz_id == quiz_id,
+            or_(*[QuizAttempt.packed_responses.contains([{"o": option_id}]) for option_id in removed]),
+        )
+        .values(packed_responses=repacked)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# Migration between layouts
+def pack_attempts(db: Session, attempt_ids: list, submitted_from: datetime, submitted_to: datetime) -> None:
+    """Move the response rows of the given attempts into ``packed_responses``."""
+    in_chunk = (
+        QuizResponseModel.attempt_id.in_(attempt_ids),
+        QuizResponseModel.submitted_at.between(submitted_from, submitted_to),
+    )
+    packed = (
+        select(
+            QuizResponseModel.attempt_id,
+            QuizResponseModel.submitted_at,
+            # Rows keep no submission order, so answers are packed in question order
+            func.jsonb_agg(aggregate_order_by(
+                func.jsonb_build_object(
+                    "q", QuizResponseModel.question_id,
+                    "o", QuizResponseModel.selected_option_id,
+                    "t", QuizResponseModel.text_response,
+                    "c", QuizResponseModel.is_correct,
+                    "p", QuizResponseModel.points_earned,
+                ),
+                Question.order, QuizResponseModel.question_id,
+            )).label("packed"),
+        )
+        .outerjoin(Question, Question.id == QuizResponseModel.question_id)
+        .where(*in_chunk)
+        .group_by(QuizResponseModel.attempt_id, QuizResponseModel.submitted_at)
+        .subquery()
+    )
+    db.execute(
+        update(QuizAttempt)
+        .where(QuizAttempt.id == packed.c.attempt_id, QuizAttempt.submitted_at == packed.c.submitted_at)
+        .values(packed_responses=packed.c.packed)
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(delete(QuizResponseModel).where(*in_chunk).execution_options(synchronize_session=False))
+
+
+def unpack_attempts(db: Session, attempt_ids: list, submitted_from: datetime, submitted_to: datetime) -> None:
+    """Expand ``packed_responses`` of the given attempts back into response rows."""
+    in_chunk = (
+        QuizAttempt.id.in_(attempt_ids),
+        QuizAttempt.submitted_at.between(submitted_from, submitted_to),
+        QuizAttempt.packed_responses.isnot(None),
+    )
+    elements = packed_elements()
+    element = elements.c.value
+    rows = (
+        select(
+            func.gen_random_uuid(),
+            QuizAttempt.id,
+            QuizAttempt.submitted_at,
+            cast(element["q"].astext, PG_UUID(as_uuid=True)),
+            cast(element["o"].astext, PG_UUID(as_uuid=True)),
+            element["t"].astext,
+            cast(element["c"].astext, Boolean),
+            cast(element["p"].astext, Integer),
+        )
+        .select_from(QuizAttempt)
+        .join(elements, true())
+        .where(*in_chunk)
+    )
+    db.execute(insert(QuizResponseModel).from_select(
+        ["id", "attempt_id", "submitted_at", "question_id", "selected_option_id",
+         "text_response", "is_correct", "points_earned"],
+        rows
+    ))
+    db.execute(
+        update(QuizAttempt).where(*in_chunk).values(packed_responses=null())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _attempt_partitions(db: Session) -> list:
+    """Leaf tables of quiz_attempts; just quiz_attempts itself when it is not partitioned."""
+    return db.scalars(text(
+        "SELECT relid::regclass::text FROM pg_partition_tree('quiz_attempts') WHERE isleaf ORDER BY 1"
+    )).all()
+
+
+def migrate_storage(to: str, batch_size: int = 1000) -> int:
+    """Move every attempt to the ``to`` layout in committed batches; returns attempts visited.
+
+    Partitions are walked one at a time in primary key order, so every batch is
+    an index range scan of a single partition.
+    """
+    move = pack_attempts if to == PACKED else unpack_attempts
+    db = SessionLocal()
+    try:
+        db.execute(text("ALTER TABLE quiz_attempts ADD COLUMN IF NOT EXISTS packed_responses JSONB"))
+        db.commit()
+
+        visited = 0
+        for partition in _attempt_partitions(db):
+            attempts = table(
+                partition, column("id", PG_UUID(as_uuid=True)), column("submitted_at", DateTime(timezone=True))
+            )
+            cursor = None
+            while True:
+                query = select(attempts.c.id, attempts.c.submitted_at)
+                if cursor is not None:
+                    query = query.where(tuple_(attempts.c.id, attempts.c.submitted_at) > tuple_(*cursor))
+                chunk = db.execute(
+                    query.order_by(attempts.c.id, attempts.c.submitted_at).limit(batch_size)
+                ).all()
+                if not chunk:
+                    break
+
+                submitted = [row.submitted_at for row in chunk]
+                move(db, [row.id for row in chunk], min(submitted), max(submitted))
+                db.commit()
+                visited += len(chunk)
+                cursor = (chunk[-1].id, chunk[-1].submitted_at)
+        return visited
+    finally:
+        db.close()
+
+
+# Benchmark
+def _storage_bytes(db: Session) -> int:
+    return db.execute(text(
+        "SELECT coalesce(sum(pg_total_relation_size(relid)), 0) FROM ("
+        "SELECT relid FROM pg_partition_tree('quiz_attempts') "
+        "UNION ALL SELECT relid FROM pg_partition_tree('quiz_responses')) AS tree"
+    )).scalar()
+
+
+def _storage_rows(db: Session, attempt_ids: list) -> int:
+    response_rows = db.scalar(
+        select(func.count()).select_from(QuizResponseModel).where(QuizResponseModel.attempt_id.in_(attempt_ids))
+    )
+    return len(attempt_ids) + response_rows
+
+
+def benchmark_storage(question_count: int = 100, attempt_count: int = 200) -> dict:
+    """Insert ``attempt_count`` attempts in each layout and report per-attempt cost.
+
+    Creates and afterwards deletes a throwaway quiz; run it against a scratch database.
+    """
+    db = SessionLocal()
+    quiz = Quiz(title="Response storage benchmark")
+    db.add(quiz)
+    db.flush()
+    questions = []
+    for order in range(question_count):
+        question = Question(
+            quiz_id=quiz.id, question_text=f"Question {order}",
+            question_type=QuestionType.MCQ, points=1, order=order
+        )
+        question.options = [
+            QuestionOption(option_text=f"Option {index}", is_correct=index == 0, order=index)
+            for index in range(4)
+        ]
+        questions.append(question)
+    db.add_all(questions)
+    db.commit()
+
+    # Plain values, so the commits in the timed loop do not expire and reload the questions
+    quiz_id = quiz.id
+    answers = [(question.id, question.options[1].id) for question in questions]
+
+    results = {}
+    try:
+        for mode in STORAGE_MODES:
+            bytes_before = _storage_bytes(db)
+            attempt_ids = []
+            started = time.perf_counter()
+            for _ in range(attempt_count):
+                attempt = QuizAttempt(
+                    quiz_id=quiz_id, score=0, total_points=question_count, percentage=0
+                )
+                store_responses(attempt, [
+                    ResponseView(
+                        question_id=question_id,
+                        selected_option_id=option_id,
+                        text_response=None,
+                        is_correct=False,
+                        points_earned=0,
+                    )
+                    for question_id, option_id in answers
+                ], mode=mode)
+                db.add(attempt)
+                db.flush()
+                attempt_ids.append(attempt.id)
+                db.commit()
+            elapsed = time.perf_counter() - started
+
+            results[mode] = {
+                "rows_per_attempt": _storage_rows(db, attempt_ids) / attempt_count,
+                "bytes_per_attempt": (_storage_bytes(db) - bytes_before) / attempt_count,
+                "insert_ms_per_attempt": elapsed * 1000 / attempt_count,
+            }
+    finally:
+        db.rollback()
+        db.execute(delete(QuizAttempt).where(QuizAttempt.quiz_id == quiz.id))
+        db.delete(quiz)
+        db.commit()
+        db.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage quiz response storage layouts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Move existing attempts to another layout")
+    migrate_parser.add_argument("--to", choices=STORAGE_MODES, required=True)
+    migrate_parser.add_argument("--batch-size", type=int, default=1000)
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="Compare the layouts on a scratch database")
+    benchmark_parser.add_argument("--questions", type=int, default=100)
+    benchmark_parser.add_argument("--attempts", type=int, default=200)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        visited = migrate_storage(args.to, args.batch_size)
+        print(f"Moved {visited} attempts to {args.to} storage")
+    elif args.command == "benchmark":
+        results = benchmark_storage(args.questions, args.attempts)
+        print(f"{'layout':<8} {'rows/attempt':>14} {'bytes/attempt':>14} {'insert ms/attempt':>18}")
+        for mode, result in results.items():
+            print(
+                f"{mode:<8} {result['rows_per_attempt']:>14.1f} {result['bytes_per_attempt']:>14.0f} "
+                f"{result['insert_ms_per_attempt']:>18.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
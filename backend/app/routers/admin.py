@@ -1,18 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy import func
 from typing import List
 from uuid import UUID
 
 from app.database import get_db
-from app.models import Quiz, Question, QuestionOption, QuestionType
+from app.models import (
+    Quiz, Question, QuestionOption, QuestionType,
+    RegradeJob, RegradeJobStatus
+)
 from app.schemas import (
     QuizCreate, QuizUpdate, QuizResponse, QuizWithQuestions,
-    QuestionCreate, QuestionUpdate, QuestionResponse
+    QuestionCreate, QuestionUpdate, QuestionResponse, RegradeRequest, RegradeJobResponse, RequestProfileResponse,
+    StreamTokenResponse
 )
-from app.auth import get_current_user
+from app.auth import STREAM_TOKEN_EXPIRE_SECONDS, create_stream_token, get_current_user, get_stream_user
+from app.live import broadcaster, quiz_exists, stream_events
+from app.profiling import ProfiledRoute, get_profile, profiles
+from app.response_store import clear_removed_options
+from app.regrade import job_is_claimable, job_is_held, run_regrade_job
 
-router = APIRouter(prefix="/api/admin", tags=["admin"])
+router = APIRouter(prefix="/api/admin", tags=["admin"], route_class=ProfiledRoute)
 
 
 # Quiz CRUD
@@ -150,14 +160,32 @@ def update_question(question_id: UUID, question_update: QuestionUpdate, db: Sess
     if question_update.correct_answer_text is not None:
         db_question.correct_answer_text = question_update.correct_answer_text
     
-    # Update options if provided
+    # Update options if provided, keeping ids stable so stored responses still
+    # point at the same options (and can be regraded) after an answer key fix
     if question_update.options is not None:
-        # Delete existing options
-        db.query(QuestionOption).filter(QuestionOption.question_id == question_id).delete()
-        # Create new options
+        existing_by_id = {opt.id: opt for opt in db_question.options}
+        kept_ids = {opt.id for opt in question_update.options if opt.id is not None}
+        unknown_ids = kept_ids - existing_by_id.keys()
+        if unknown_ids or len(kept_ids) != sum(1 for opt in question_update.options if opt.id is not None):
+            raise HTTPException(status_code=400, detail="Options reference unknown or duplicate option ids")
+        
+        # Options sent without an id are always new; reusing a removed option's row
+        # would silently repoint the responses that picked it
         for opt_data in question_update.options:
-            db_option = QuestionOption(question_id=question_id, **opt_data.dict())
-            db.add(db_option)
+            if opt_data.id is not None:
+                db_option = existing_by_id[opt_data.id]
+            else:
+                db_option = QuestionOption(question_id=question_id)
+                db.add(db_option)
+            for field, value in opt_data.dict(exclude={"id"}).items():
+                setattr(db_option, field, value)
+
+        # Answers that picked a removed option no longer reference a valid answer
+        removed_ids = [opt_id for opt_id in existing_by_id if opt_id not in kept_ids]
+        if removed_ids:
+            clear_removed_options(db, db_question.quiz_id, removed_ids)
+            for opt_id in removed_ids:
+                db.delete(existing_by_id[opt_id])
     
     db.commit()
     db.refresh(db_question)
@@ -174,3 +202,112 @@ def delete_question(question_id: UUID, db: Session = Depends(get_db), current_us
     db.commit()
     return None
 
+
+# Regrading
+@router.post("/quizzes/{quiz_id}/regrade", response_model=RegradeJobResponse, status_code=status.HTTP_202_ACCEPTED)
+def start_regrade(quiz_id: UUID, regrade: RegradeRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
+    """Regrade the stored answers to the given questions, e.g. after fixing their answer key."""
+    quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    
+    question_ids = set(regrade.question_ids)
+    found = db.query(Question.id).filter(Question.quiz_id == quiz_id, Question.id.in_(question_ids)).count()
+    if found != len(question_ids):
+        raise HTTPException(status_code=400, detail="question_ids must be questions of this quiz")
+    
+    active_job = db.query(RegradeJob).filter(RegradeJob.quiz_id == quiz_id, job_is_held()).first()
+    if active_job:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Regrade job {active_job.id} is already in progress for this quiz"
+        )
+    
+    # Jobs whose runner died are marked failed (they can still be resumed) and lose their
+    # lease, so a runner that is only slow stops at its next chunk instead of racing the new job
+    db.query(RegradeJob).filter(
+        RegradeJob.quiz_id == quiz_id,
+        RegradeJob.status.in_([RegradeJobStatus.PENDING, RegradeJobStatus.RUNNING])
+    ).update(
+        {
+            RegradeJob.status: RegradeJobStatus.FAILED,
+            RegradeJob.lease_owner: None,
+            RegradeJob.error: "Lease expired; superseded by a new job",
+        },
+        synchronize_session=False
+    )
+    
+    job = RegradeJob(quiz_id=quiz_id, question_ids=sorted(question_ids))
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    
+    background_tasks.add_task(run_regrade_job, job.id)
+    return job
+
+
+@router.get("/regrade-jobs/{job_id}", response_model=RegradeJobResponse)
+def get_regrade_job(job_id: UUID, db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
+    job = db.query(RegradeJob).filter(RegradeJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Regrade job not found")
+    return job
+
+
+@router.post("/regrade-jobs/{job_id}/resume", response_model=RegradeJobResponse, status_code=status.HTTP_202_ACCEPTED)
+def resume_regrade_job(job_id: UUID, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
+    """Resume a failed or interrupted job (or one whose lease expired) from its last committed chunk."""
+    job = db.query(RegradeJob).filter(RegradeJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Regrade job not found")
+    if job.status == RegradeJobStatus.COMPLETED:
+        raise HTTPException(status_code=409, detail="Regrade job already completed")
+    if not db.query(RegradeJob).filter(RegradeJob.id == job_id, job_is_claimable()).first():
+        raise HTTPException(status_code=409, detail="Regrade job is still held by a running worker")
+    
+    # The runner claims the job atomically, so a concurrent resume cannot start a second runner
+    background_tasks.add_task(run_regrade_job, job.id)
+    return job
+
+
+# Live results
+@router.post("/quizzes/{quiz_id}/live-token", response_model=StreamTokenResponse)
+def create_live_token(quiz_id: UUID, db: Session = Depends(get_db), current_user: str = Depends(get_current_user)):
+    """Issue a short-lived token for the live stream, so the admin JWT never appears in a URL."""
+    quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    
+    return StreamTokenResponse(stream_token=create_stream_token(quiz_id), expires_in=STREAM_TOKEN_EXPIRE_SECONDS)
+
+
+@router.get("/quizzes/{quiz_id}/live")
+async def live_results(quiz_id: UUID, current_user: str = Depends(get_stream_user)):
+    """Server-sent events with every new attempt and the running average, for proctor dashboards."""
+    if not await run_in_threadpool(quiz_exists, quiz_id):
+        raise HTTPException(status_code=404, detail="Quiz not found")
+    
+    subscription = await broadcaster.subscribe(quiz_id)
+    return StreamingResponse(
+        stream_events(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Profiling (profiles are kept per worker process)
+@router.get("/profiles", response_model=List[RequestProfileResponse])
+def list_profiles(current_user: str = Depends(get_current_user)):
+    return list(reversed(profiles))
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+def download_profile(profile_id: UUID, current_user: str = Depends(get_current_user)):
+    """Stack samples of one profile in collapsed format, ready for flamegraph tools."""
+    profile = get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(
+        profile.collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile.id}.folded"'}
+    )
@@ -8,8 +8,9 @@ from app.auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     Token
 )
+from app.profiling import ProfiledRoute
 
-router = APIRouter(prefix="/api/auth", tags=["auth"])
+router = APIRouter(prefix="/api/auth", tags=["auth"], route_class=ProfiledRoute)
 
 
 @router.post("/login", response_model=Token)
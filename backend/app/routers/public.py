@@ -1,21 +1,39 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session, joinedload
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 from decimal import Decimal
 
 from app.database import get_db
-from app.models import Quiz, Question, QuestionOption, QuizAttempt, QuizResponse as QuizResponseModel, QuestionType
+from app.models import Quiz, Question, QuestionOption, QuizAttempt, QuestionType
+from app.profiling import ProfiledRoute
+from app.live import publish_attempt
+from app.response_store import ResponseView, store_responses
 from app.schemas import PublicQuizResponse, QuizSubmission, QuizResultResponse, AnswerSubmission
 
-router = APIRouter(prefix="/api/public", tags=["public"])
+router = APIRouter(prefix="/api/public", tags=["public"], route_class=ProfiledRoute)
 
 
-@router.get("/quizzes/{quiz_id}", response_model=PublicQuizResponse)
-def get_quiz_for_taking(quiz_id: UUID, db: Session = Depends(get_db)):
-    quiz = db.query(Quiz).options(
+def text_answer_is_correct(text_response: Optional[str], correct_answer_text: Optional[str]) -> bool:
+    """Case-insensitive comparison of a text answer with the key; also used by regrading."""
+    if not text_response or not correct_answer_text:
+        return False
+    return text_response.strip().lower() == correct_answer_text.strip().lower()
+
+
+def load_quiz_for_taking(db: Session, quiz_id: UUID):
+    return db.query(Quiz).options(
         joinedload(Quiz.questions).joinedload(Question.options)
     ).filter(Quiz.id == quiz_id).first()
+
+
+def load_quiz_questions(db: Session, quiz_id: UUID):
+    return db.query(Question).filter(Question.quiz_id == quiz_id).order_by(Question.order).all()
+
+
+@router.get("/quizzes/{quiz_id}", response_model=PublicQuizResponse)
+def get_quiz_for_taking(quiz_id: UUID, db: Session = Depends(get_db)):
+    quiz = load_quiz_for_taking(db, quiz_id)
     if not quiz:
         raise HTTPException(status_code=404, detail="Quiz not found")
     
@@ -31,7 +49,7 @@ def submit_quiz(quiz_id: UUID, submission: QuizSubmission, db: Session = Depends
         raise HTTPException(status_code=404, detail="Quiz not found")
     
     # Get all questions for this quiz
-    questions = db.query(Question).filter(Question.quiz_id == quiz_id).order_by(Question.order).all()
+    questions = load_quiz_questions(db, quiz_id)
     question_dict = {q.id: q for q in questions}
     
     # Validate submission
@@ -52,6 +70,7 @@ def submit_quiz(quiz_id: UUID, submission: QuizSubmission, db: Session = Depends
     total_points = sum(q.points for q in questions)
     score = 0
     responses_data = []
+    stored_responses = []
     
     for answer in submission.answers:
         question = question_dict[answer.question_id]
@@ -70,12 +89,10 @@ def submit_quiz(quiz_id: UUID, submission: QuizSubmission, db: Session = Depends
                     points_earned = question.points
                     score += question.points
         elif question.question_type == QuestionType.TEXT:
-            if answer.text_response and question.correct_answer_text:
-                # Case-insensitive comparison
-                if answer.text_response.strip().lower() == question.correct_answer_text.strip().lower():
-                    is_correct = True
-                    points_earned = question.points
-                    score += question.points
+            if text_answer_is_correct(answer.text_response, question.correct_answer_text):
+                is_correct = True
+                points_earned = question.points
+                score += question.points
         
         responses_data.append({
             "question_id": str(question.id),
@@ -84,6 +101,13 @@ def submit_quiz(quiz_id: UUID, submission: QuizSubmission, db: Session = Depends
             "points_earned": points_earned,
             "question_points": question.points
         })
+        stored_responses.append(ResponseView(
+            question_id=question.id,
+            selected_option_id=answer.selected_option_id,
+            text_response=answer.text_response,
+            is_correct=is_correct,
+            points_earned=points_earned
+        ))
     
     # Calculate percentage
     percentage = (Decimal(score) / Decimal(total_points) * 100) if total_points > 0 else Decimal(0)
@@ -96,25 +120,20 @@ def submit_quiz(quiz_id: UUID, submission: QuizSubmission, db: Session = Depends
         total_points=total_points,
         percentage=percentage
     )
+    
+    # Create responses (as rows or packed, depending on RESPONSE_STORAGE_MODE), in question
+    # order like attempts packed by the layout migration
+    stored_responses.sort(key=lambda response: (question_dict[response.question_id].order, str(response.question_id)))
+    store_responses(attempt, stored_responses)
     db.add(attempt)
     db.flush()
     
-    # Create responses
-    for answer in submission.answers:
-        question = question_dict[answer.question_id]
-        response = QuizResponseModel(
-            attempt_id=attempt.id,
-            question_id=question.id,
-            selected_option_id=answer.selected_option_id,
-            text_response=answer.text_response,
-            is_correct=responses_data[submission.answers.index(answer)]["is_correct"],
-            points_earned=responses_data[submission.answers.index(answer)]["points_earned"]
-        )
-        db.add(response)
-    
     db.commit()
     db.refresh(attempt)
     
+    # Sent to live dashboards in the worker's next batched NOTIFY, outside this transaction
+    publish_attempt(attempt)
+    
     return QuizResultResponse(
         attempt_id=attempt.id,
         quiz_id=quiz_id,
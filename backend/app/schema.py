@@ -0,0 +1,22 @@
+"""Schema creation, kept out of the serving path.
+
+Serving workers do not create tables; they only create upcoming attempt
+partitions. Run this once per deploy (or set ``SCHEMA_INIT=true`` to have
+workers do it during warm-up, as in development):
+
+    python -m app.schema
+"""
+from sqlalchemy.engine import Engine
+
+from app.database import Base, engine as default_engine
+from app.partitions import ensure_partitions
+
+
+def init_schema(bind: Engine = default_engine) -> None:
+    """Create missing tables and the upcoming attempt partitions."""
+    Base.metadata.create_all(bind=bind)
+    ensure_partitions(bind)
+
+
+if __name__ == "__main__":
+    init_schema()
@@ -2,7 +2,7 @@ from pydantic import BaseModel, Field
 from typing import List, Optional
 from uuid import UUID
 from datetime import datetime
-from app.models import QuestionType
+from app.models import QuestionType, RegradeJobStatus
 
 
 # Quiz Schemas
@@ -40,6 +40,10 @@ class QuestionOptionCreate(QuestionOptionBase):
     pass
 
 
+class QuestionOptionUpdate(QuestionOptionBase):
+    id: Optional[UUID] = None  # Existing option to update in place; omitted for new options
+
+
 class QuestionOptionResponse(QuestionOptionBase):
     id: UUID
 
@@ -65,7 +69,7 @@ class QuestionUpdate(BaseModel):
     question_type: Optional[QuestionType] = None
     points: Optional[int] = Field(None, ge=1)
     order: Optional[int] = None
-    options: Optional[List[QuestionOptionCreate]] = None
+    options: Optional[List[QuestionOptionUpdate]] = None
     correct_answer_text: Optional[str] = None
 
 
@@ -142,3 +146,49 @@ class QuizResultResponse(BaseModel):
     class Config:
         from_attributes = True
 
+
+
+# Regrade Job Schemas
+class RegradeRequest(BaseModel):
+    question_ids: List[UUID] = Field(..., min_length=1)  # Questions whose answer key was fixed
+
+
+class RegradeJobResponse(BaseModel):
+    id: UUID
+    quiz_id: UUID
+    question_ids: List[UUID]
+    status: RegradeJobStatus
+    total_attempts: int
+    processed_attempts: int
+    responses_updated: int
+    attempts_updated: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+# Live Results Schemas
+class StreamTokenResponse(BaseModel):
+    stream_token: str
+    expires_in: int
+
+
+# Request Profile Schemas
+class RequestProfileResponse(BaseModel):
+    id: UUID
+    method: str
+    path: str
+    status_code: Optional[int] = None
+    started_at: datetime
+    wall_ms: float
+    sql_ms: float
+    python_ms: float
+    sql_count: int
+    sample_count: int
+
+    class Config:
+        from_attributes = True
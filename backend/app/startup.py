@@ -0,0 +1,150 @@
+"""Worker warm-up, run in the background from the app lifespan.
+
+Importing the app does no I/O, so a new worker starts accepting connections
+straight away and ``/health`` answers at once. Warm-up then waits for Postgres,
+optionally creates the tables (``SCHEMA_INIT=true``), creates the upcoming
+attempt partitions (always; rechecked every ``PARTITION_CHECK_MINUTES`` by
+``maintain_partitions``), opens and pre-pings the
+connection pool, and primes the quizzes that are being taken right now. It
+also computes the admin password hash, which would otherwise slow down the
+first login. ``/ready`` reports 503 until all of that has finished.
+
+Only ``OperationalError`` (database not reachable yet) is retried. Any other
+error ends the warm-up: it is logged and ``/ready`` keeps reporting 503 with
+the error, so the deployment fails instead of retrying a broken setup forever.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+
+from sqlalchemy import distinct, func, select, text
+from sqlalchemy.exc import OperationalError
+
+from app.auth import get_admin_password_hash
+from app.database import SessionLocal, engine
+from app.models import QuizAttempt
+from app.partitions import ensure_partitions
+from app.routers.public import load_quiz_for_taking, load_quiz_questions
+from app.schema import init_schema
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_INIT = os.getenv("SCHEMA_INIT", "false").lower() == "true"
+WARMUP_ACTIVE_MINUTES = int(os.getenv("WARMUP_ACTIVE_MINUTES", "60"))
+WARMUP_QUIZ_LIMIT = int(os.getenv("WARMUP_QUIZ_LIMIT", "20"))
+WARMUP_RETRY_SECONDS = 2
+PARTITION_CHECK_MINUTES = int(os.getenv("PARTITION_CHECK_MINUTES", "60"))
+PROBE_PATHS = {"/health", "/ready"}
+
+
+class StartupState:
+    def __init__(self):
+        # Overwritten by app.main with the time its own import began
+        self.import_started = time.perf_counter()
+        self.ready = False
+        self.warm_up_error = None
+        self.import_to_ready_ms = None
+        self.import_to_first_request_ms = None
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.import_started) * 1000, 1)
+
+
+state = StartupState()
+
+
+def prewarm_pool() -> None:
+    """Open up to pool_size connections at once and ping each, so they are pooled before traffic."""
+    connections = []
+    try:
+        for _ in range(engine.pool.size()):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def warm_active_quizzes() -> int:
+    """Run the public quiz queries for quizzes with recent attempts; returns how many were warmed.
+
+    This pulls their questions and options into Postgres' buffer cache and fills
+    this worker's compiled statement cache for the quiz-taking endpoints.
+    """
+    db = SessionLocal()
+    try:
+        quiz_ids = db.scalars(
+            select(distinct(QuizAttempt.quiz_id))
+            .where(QuizAttempt.submitted_at >= func.now() - timedelta(minutes=WARMUP_ACTIVE_MINUTES))
+            .limit(WARMUP_QUIZ_LIMIT)
+        ).all()
+        for quiz_id in quiz_ids:
+            load_quiz_for_taking(db, quiz_id)
+            load_quiz_questions(db, quiz_id)
+        return len(quiz_ids)
+    finally:
+        db.close()
+
+
+async def warm_up() -> None:
+    while True:
+        try:
+            # Both are idempotent and cheap once done; the partitions are never left to DEFAULT
+            await asyncio.to_thread(init_schema if SCHEMA_INIT else ensure_partitions)
+            await asyncio.to_thread(prewarm_pool)
+            break
+        except OperationalError:
+            logger.warning("Database not reachable yet, retrying in %ds", WARMUP_RETRY_SECONDS, exc_info=True)
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+    try:
+        warmed = await asyncio.to_thread(warm_active_quizzes)
+        logger.info("Warmed %d active quizzes", warmed)
+    except Exception:
+        # Cold caches only cost latency, so they never block readiness
+        logger.warning("Quiz warm-up failed", exc_info=True)
+    await asyncio.to_thread(get_admin_password_hash)
+
+    state.ready = True
+    state.import_to_ready_ms = state.elapsed_ms()
+    logger.info("Worker ready %.1f ms after import", state.import_to_ready_ms)
+
+
+async def maintain_partitions() -> None:
+    """Keep creating upcoming partitions for as long as the worker runs, so a new month never lands in DEFAULT."""
+    while True:
+        await asyncio.sleep(PARTITION_CHECK_MINUTES * 60)
+        try:
+            await asyncio.to_thread(ensure_partitions)
+        except Exception:
+            logger.exception("Could not create upcoming partitions, retrying in %d minutes", PARTITION_CHECK_MINUTES)
+
+
+def report_warm_up(task: asyncio.Task) -> None:
+    """Done-callback for the warm-up task, so its failure is logged and shown by /ready."""
+    if task.cancelled() or task.exception() is None:
+        return
+    error = task.exception()
+    state.warm_up_error = f"{type(error).__name__}: {error}"
+    logger.error("Worker warm-up failed; /ready stays unavailable", exc_info=error)
+
+
+class FirstRequestTimer:
+    """ASGI middleware that records how long after import the first non-probe HTTP request arrived."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Probes start as soon as the port opens, so they do not count as traffic
+        if (
+            state.import_to_first_request_ms is None
+            and scope["type"] == "http"
+            and scope["path"] not in PROBE_PATHS
+        ):
+            state.import_to_first_request_ms = state.elapsed_ms()
+            logger.info("First request %.1f ms after import", state.import_to_first_request_ms)
+        await self.app(scope, receive, send)
@@ -65,6 +65,16 @@ export const adminAPI = {
   createQuestion: (quizId, data) => api.post(`/api/admin/quizzes/${quizId}/questions`, data),
   updateQuestion: (questionId, data) => api.put(`/api/admin/questions/${questionId}`, data),
   deleteQuestion: (questionId) => api.delete(`/api/admin/questions/${questionId}`),
+  regradeQuiz: (quizId, questionIds) =>
+    api.post(`/api/admin/quizzes/${quizId}/regrade`, { question_ids: questionIds }),
+  getRegradeJob: (jobId) => api.get(`/api/admin/regrade-jobs/${jobId}`),
+  resumeRegradeJob: (jobId) => api.post(`/api/admin/regrade-jobs/${jobId}/resume`),
+  // EventSource cannot send headers, so the URL carries a short-lived token that
+  // only opens this quiz's stream; fetch a fresh URL for every (re)connect
+  getLiveResultsUrl: async (quizId) => {
+    const response = await api.post(`/api/admin/quizzes/${quizId}/live-token`)
+    return `${API_URL}/api/admin/quizzes/${quizId}/live?stream_token=${encodeURIComponent(response.data.stream_token)}`
+  },
 }
 
 // Public API
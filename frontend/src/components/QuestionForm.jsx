@@ -21,6 +21,7 @@ function QuestionForm({ quizId, question, onClose, onSuccess }) {
         order: question.order || 1,
         options: question.options?.length > 0
           ? question.options.map((opt, idx) => ({
+              id: opt.id,
               option_text: opt.option_text,
               is_correct: opt.is_correct,
               order: opt.order || idx + 1,